@@ -1,12 +1,27 @@
+import asyncio
+import codecs
+import functools
+import hashlib
+import hmac
 import os
 import secrets
+import shutil
+import time
+from dataclasses import dataclass, fields
 from typing import Optional
 from fastapi import FastAPI, Request, Depends, Form, HTTPException, status, UploadFile, File
-from fastapi.responses import HTMLResponse, RedirectResponse, Response, PlainTextResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse, RedirectResponse, Response, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 import pathlib
-from sqlmodel import SQLModel, Field, Session, create_engine, select
+import anyio
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from markupsafe import Markup
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, Field, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from slugify import slugify
 import httpx
 
@@ -16,8 +31,37 @@ ADMIN_USERNAME = os.getenv("ADMIN_USERNAME", "admin")
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "changeme")
 ADMIN_TOKEN: Optional[str] = os.getenv("ADMIN_TOKEN")
 ALLOWED_PARENTS = os.getenv("ALLOWED_FRAME_PARENTS", "*")
+CSP_HEADER = f"frame-ancestors {ALLOWED_PARENTS}".encode("latin-1")
+ICS_CACHE_TTL = int(os.getenv("CALHUB_ICS_CACHE_TTL", "60"))
+ICS_FETCH_CONCURRENCY = int(os.getenv("CALHUB_ICS_FETCH_CONCURRENCY", "8"))
+# Re-read templates from disk when they change (handy while editing them)
+TEMPLATE_RELOAD = os.getenv("CALHUB_TEMPLATE_RELOAD", "").lower() in ("1", "true", "yes")
+
+# aiosqlite runs each query on its own thread so the event loop stays free
+engine = create_async_engine(
+    f"sqlite+aiosqlite:///{DB_PATH}",
+    connect_args={"check_same_thread": False},
+    pool_size=5,
+    max_overflow=10,
+)
+
+# Applied to every new SQLite connection so pool reconnects get the same tuning.
+# WAL lets readers proceed while a write is in flight and synchronous=NORMAL
+# skips the per-commit fsync of the rollback journal.
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-20000",
+)
 
-engine = create_engine(f"sqlite:///{DB_PATH}", connect_args={"check_same_thread": False})
+@event.listens_for(engine.sync_engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
 
 class Calendar(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -38,14 +82,68 @@ class Calendar(SQLModel, table=True):
     show_name: bool = True
     is_public: bool = True
 
-def init_db():
-    SQLModel.metadata.create_all(engine)
-
-def get_session():
-    with Session(engine) as session:
+@dataclass(frozen=True)
+class CalendarSnapshot:
+    """Read-only copy of a public calendar, safe to share across requests."""
+    name: str
+    slug: str
+    incoming_ics_url: Optional[str]
+    primary_color: str
+    accent_color: str
+    background_color: str
+    text_color: str
+    title_color: str
+    logo_url: Optional[str]
+    logo_height: int
+    timezone: str
+    desktop_view: str
+    mobile_view: str
+    show_name: bool
+
+# Public calendars keyed by slug. Entries are dropped whenever an admin
+# writes to the calendar, so the public endpoints skip the DB on repeat hits.
+CAL_CACHE_SIZE = 1024
+CAL_CACHE: dict[str, CalendarSnapshot] = {}
+# Bumped on every write so a read that raced the write doesn't re-cache old data
+CAL_GENERATION: dict[str, int] = {}
+SNAPSHOT_COLUMNS = tuple(getattr(Calendar, f.name) for f in fields(CalendarSnapshot))
+
+async def init_db():
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.exec_driver_sql("ANALYZE")
+
+async def get_session():
+    # AsyncSession can't lazily reload expired attributes (that IO would run
+    # outside the greenlet), so keep loaded rows usable after commit
+    async with AsyncSession(engine, expire_on_commit=False) as session:
         yield session
 
-app = FastAPI()
+async def get_calendar_by_slug(session: AsyncSession, slug: str) -> Optional[CalendarSnapshot]:
+    """Look up a public calendar, serving repeat lookups from CAL_CACHE."""
+    cal = CAL_CACHE.get(slug)
+    if cal is not None:
+        return cal
+    generation = CAL_GENERATION.get(slug, 0)
+    row = (await session.exec(
+        select(*SNAPSHOT_COLUMNS).where(Calendar.slug == slug, Calendar.is_public == True)
+    )).first()
+    if not row:
+        return None
+    cal = CalendarSnapshot(*row)
+    if CAL_GENERATION.get(slug, 0) != generation:
+        return cal
+    if len(CAL_CACHE) >= CAL_CACHE_SIZE:
+        CAL_CACHE.pop(next(iter(CAL_CACHE)))
+    CAL_CACHE[slug] = cal
+    return cal
+
+def invalidate_calendar(slug: str) -> None:
+    """Drop a calendar's cached snapshot after it has been written."""
+    CAL_GENERATION[slug] = CAL_GENERATION.get(slug, 0) + 1
+    CAL_CACHE.pop(slug, None)
+
+app = FastAPI(default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -60,12 +158,30 @@ os.makedirs("/data/uploads", exist_ok=True)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 app.mount("/uploads", StaticFiles(directory="/data/uploads"), name="uploads")
 
+# Templates are compiled once and kept in memory; handlers only render them.
+# HTML templates are autoescaped; JS templates pass values through |tojson.
+templates = Environment(
+    loader=FileSystemLoader("templates"),
+    autoescape=select_autoescape(["html"]),
+    auto_reload=TEMPLATE_RELOAD,
+    cache_size=-1,
+)
+for _name in templates.list_templates():
+    templates.get_template(_name)
+
+def render(name: str, **context) -> str:
+    """Render a cached template with the given context."""
+    return templates.get_template(name).render(**context)
+
+# The login page has no dynamic parts, so it is served as raw bytes
+LOGIN_HTML = pathlib.Path("templates/login.html").read_bytes()
+
 # Global headers to allow embedding from your domains
 @app.middleware("http")
 async def frame_headers(request: Request, call_next):
     resp = await call_next(request)
     # No X-Frame-Options so embedding works
-    resp.headers["Content-Security-Policy"] = f"frame-ancestors {ALLOWED_PARENTS}"
+    resp.headers.raw.append((b"content-security-policy", CSP_HEADER))
     return resp
 
 @app.get("/health", include_in_schema=False)
@@ -73,18 +189,107 @@ async def health():
     return Response(status_code=204)
 
 
+def credential_digest(value: str) -> bytes:
+    """Hash a credential so comparisons run over fixed-length digests."""
+    return hashlib.sha256(value.encode("utf-8")).digest()
+
+ADMIN_USERNAME_DIGEST = credential_digest(ADMIN_USERNAME)
+ADMIN_PASSWORD_DIGEST = credential_digest(ADMIN_PASSWORD)
+
 @app.post("/admin/login")
 async def admin_login(username: str = Form(...), password: str = Form(...)):
     global ADMIN_TOKEN
-    if username == ADMIN_USERNAME and password == ADMIN_PASSWORD:
+    # Compare both fields without short-circuiting so timing leaks neither
+    username_ok = hmac.compare_digest(credential_digest(username), ADMIN_USERNAME_DIGEST)
+    password_ok = hmac.compare_digest(credential_digest(password), ADMIN_PASSWORD_DIGEST)
+    if username_ok & password_ok:
         ADMIN_TOKEN = secrets.token_urlsafe(32)
         return {"token": ADMIN_TOKEN}
     raise HTTPException(status_code=401, detail="Invalid credentials")
 
-def require_admin(request: Request):
-    token = request.headers.get("X-Admin-Token") or request.query_params.get("token")
-    if not ADMIN_TOKEN or token != ADMIN_TOKEN:
+def get_admin_token(request: Request) -> str:
+    """Return the token from the X-Admin-Token header or the ?token= query."""
+    return request.headers.get("X-Admin-Token") or request.query_params.get("token") or ""
+
+def require_admin(token: str = Depends(get_admin_token)) -> str:
+    """Reject the request unless it carries the current admin token."""
+    if not ADMIN_TOKEN or not token or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
         raise HTTPException(status_code=401, detail="Unauthorized")
+    return token
+
+def admin_redirect(token: str) -> RedirectResponse:
+    """Send the browser back to the dashboard, keeping the token in the URL."""
+    return RedirectResponse(url=f"/admin?token={token}", status_code=status.HTTP_303_SEE_OTHER)
+
+UPLOAD_CHUNK_SIZE = 1 << 16
+
+def save_upload(src, dest: pathlib.Path) -> None:
+    """Copy an uploaded file to dest in fixed-size chunks."""
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    with dest.open("wb") as f:
+        shutil.copyfileobj(src, f, UPLOAD_CHUNK_SIZE)
+
+def remove_files(*paths: str) -> None:
+    """Delete files, ignoring any that are already gone or can't be removed."""
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+# Upstream ICS bodies keyed by slug: (url, etag, last_modified, body, fetched_at).
+# An entry only counts for the url it was fetched from, so a fetch of a
+# calendar's old url that finishes after an edit can't be served for the new one.
+# Within ICS_CACHE_TTL the body is served as-is; after that it is revalidated
+# with a conditional GET. Concurrent misses for a (slug, url) share one in-flight
+# fetch, and ICS_FETCH_SLOTS caps how many upstream fetches run at once.
+ICS_CACHE: dict[str, tuple[str, str, str, bytes, float]] = {}
+ICS_INFLIGHT: dict[tuple[str, str], asyncio.Task] = {}
+ICS_FETCH_SLOTS = asyncio.Semaphore(ICS_FETCH_CONCURRENCY)
+
+def cached_ics(slug: str, url: str) -> Optional[tuple[str, str, str, bytes, float]]:
+    cached = ICS_CACHE.get(slug)
+    return cached if cached and cached[0] == url else None
+
+async def fetch_ics(slug: str, url: str) -> bytes:
+    """Return the upstream ICS for a calendar, revalidating it once stale."""
+    cached = cached_ics(slug, url)
+    if cached and time.monotonic() - cached[4] < ICS_CACHE_TTL:
+        return cached[3]
+    key = (slug, url)
+    task = ICS_INFLIGHT.get(key)
+    if task is None:
+        task = asyncio.ensure_future(revalidate_ics(slug, url))
+        ICS_INFLIGHT[key] = task
+        task.add_done_callback(lambda _: ICS_INFLIGHT.pop(key, None))
+    # Shielded so a disconnecting client doesn't cancel the fetch for the others
+    return await asyncio.shield(task)
+
+async def revalidate_ics(slug: str, url: str) -> bytes:
+    cached = cached_ics(slug, url)
+    headers = {"User-Agent": "CalendarHub", "Accept": "text/calendar"}
+    if cached:
+        _, etag, last_modified, body, _ = cached
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+    async with ICS_FETCH_SLOTS:
+        r = await app.state.http.get(url, headers=headers)
+    if cached and r.status_code == 304:
+        ICS_CACHE[slug] = (url, etag, last_modified, body, time.monotonic())
+        return body
+    r.raise_for_status()
+    # Keep the raw bytes; only transcode the rare feed that isn't UTF-8
+    body = r.content if codecs.lookup(r.encoding).name in ("utf-8", "ascii") else r.text.encode()
+    ICS_CACHE[slug] = (
+        url,
+        r.headers.get("etag", ""),
+        r.headers.get("last-modified", ""),
+        body,
+        time.monotonic(),
+    )
+    return body
 
 def make_slug(text: str) -> str:
     """Create a slug from text using the python-slugify library."""
@@ -94,41 +299,44 @@ def make_slug(text: str) -> str:
 @app.get("/", response_class=HTMLResponse)
 async def root():
     """Show the admin login form."""
-    with open("templates/login.html", "r", encoding="utf-8") as f:
-        return HTMLResponse(f.read())
+    if TEMPLATE_RELOAD:
+        return HTMLResponse(render("login.html"))
+    return Response(LOGIN_HTML, media_type="text/html")
 
 # Admin dashboard
+# Markup escapes each %-argument, so calendar fields can't inject markup.
+ADMIN_ROW_TPL = Markup(
+    "<tr><td>%s</td><td>%s</td><td>%s</td>"
+    "<td><a href='/c/%s/embed' target='_blank'>preview</a> | "
+    "<a href='/admin/edit/%s%s'>edit</a> | "
+    "<a href='/admin/embed-code/%s%s'>code</a> | "
+    "<form method='post' action='/admin/delete/%s%s' style='display:inline' onsubmit=\"return confirm('Delete calendar?')\"><button type='submit'>delete</button></form></td></tr>"
+)
+
 @app.get("/admin", response_class=HTMLResponse)
-async def admin_page(request: Request, session: Session = Depends(get_session)):
-    require_admin(request)
-    calendars = session.exec(select(Calendar).order_by(Calendar.name)).all()
-    token = request.query_params.get("token") or request.headers.get("X-Admin-Token")
-    with open("templates/admin.html", "r", encoding="utf-8") as f:
-        tpl = f.read()
-    form_action = "/admin/create"
-    token_param = ""
-    if token:
-        form_action += f"?token={token}"
-        token_param = f"?token={token}"
-    table_rows = "".join(
+async def admin_page(token: str = Depends(require_admin), session: AsyncSession = Depends(get_session)):
+    calendars = (await session.exec(
+        select(Calendar.name, Calendar.slug, Calendar.incoming_ics_url).order_by(Calendar.name)
+    )).all()
+    token_param = f"?token={token}"
+    table_rows = Markup("").join(
         [
-            f"<tr><td>{c.name}</td><td>{c.slug}</td><td>{c.incoming_ics_url or ''}</td>"
-            f"<td><a href='/c/{c.slug}/embed' target='_blank'>preview</a> | "
-            f"<a href='/admin/edit/{c.slug}{token_param}'>edit</a> | "
-            f"<a href='/admin/embed-code/{c.slug}{token_param}'>code</a> | "
-            f"<form method='post' action='/admin/delete/{c.slug}{token_param}' style='display:inline' onsubmit=\"return confirm('Delete calendar?')\"><button type='submit'>delete</button></form></td></tr>"
+            ADMIN_ROW_TPL
+            % (c.name, c.slug, c.incoming_ics_url or "", c.slug, c.slug, token_param, c.slug, token_param, c.slug, token_param)
             for c in calendars
         ]
     )
     return HTMLResponse(
-        tpl.replace("{{cal_count}}", str(len(calendars)))
-        .replace("{{table_rows}}", table_rows)
-        .replace("{{form_action}}", form_action)
+        render(
+            "admin.html",
+            cal_count=len(calendars),
+            table_rows=table_rows,
+            form_action=f"/admin/create{token_param}",
+        )
     )
 
 @app.post("/admin/create", response_class=HTMLResponse)
 async def create_calendar(
-    request: Request,
     name: str = Form(...),
     slug: Optional[str] = Form(None),
     incoming_ics_url: Optional[str] = Form(None),
@@ -144,22 +352,19 @@ async def create_calendar(
     mobile_view: str = Form("listWeek"),
     show_name: bool = Form(False),
     logo_height: int = Form(40),
-    session: Session = Depends(get_session)
+    token: str = Depends(require_admin),
+    session: AsyncSession = Depends(get_session),
 ):
-    require_admin(request)
     s = slug or make_slug(name)
-    exists = session.exec(select(Calendar).where(Calendar.slug == s)).first()
+    exists = (await session.exec(select(Calendar.id).where(Calendar.slug == s))).first()
     if exists:
         raise HTTPException(status_code=400, detail="Slug already exists")
 
     saved_logo_url = logo_url
     saved_logo_path = None
     if logo_file and logo_file.filename:
-        dest_dir = pathlib.Path("/data/uploads") / s
-        dest_dir.mkdir(parents=True, exist_ok=True)
-        dest = dest_dir / logo_file.filename
-        with dest.open("wb") as f:
-            f.write(await logo_file.read())
+        dest = pathlib.Path("/data/uploads") / s / logo_file.filename
+        await anyio.to_thread.run_sync(save_upload, logo_file.file, dest)
         saved_logo_url = f"/uploads/{s}/{logo_file.filename}"
         saved_logo_path = str(dest)
 
@@ -182,55 +387,52 @@ async def create_calendar(
         is_public=True,
     )
     session.add(cal)
-    session.commit()
-    token = request.query_params.get("token") or request.headers.get("X-Admin-Token")
-    redirect_url = "/admin"
-    if token:
-        redirect_url += f"?token={token}"
-    return RedirectResponse(url=redirect_url, status_code=status.HTTP_303_SEE_OTHER)
+    try:
+        await session.commit()
+    except IntegrityError:
+        # Lost a race with a concurrent create of the same slug
+        raise HTTPException(status_code=400, detail="Slug already exists")
+    invalidate_calendar(s)
+    return admin_redirect(token)
 
 # Edit calendar
 @app.get("/admin/edit/{slug}", response_class=HTMLResponse)
-async def edit_calendar_page(request: Request, slug: str, session: Session = Depends(get_session)):
-    require_admin(request)
-    cal = session.exec(select(Calendar).where(Calendar.slug == slug)).first()
+async def edit_calendar_page(slug: str, token: str = Depends(require_admin), session: AsyncSession = Depends(get_session)):
+    cal = (await session.exec(select(Calendar).where(Calendar.slug == slug))).first()
     if not cal:
         raise HTTPException(status_code=404, detail="Calendar not found")
-    token = request.query_params.get("token") or request.headers.get("X-Admin-Token")
-    token_param = f"?token={token}" if token else ""
-    with open("templates/edit.html", "r", encoding="utf-8") as f:
-        tpl = f.read()
     def sel(val: str, target: str) -> str:
         return "selected" if val == target else ""
-    tpl = (
-        tpl.replace("{{SLUG}}", cal.slug)
-        .replace("{{NAME}}", cal.name)
-        .replace("{{ICS}}", cal.incoming_ics_url or "")
-        .replace("{{TZ}}", cal.timezone)
-        .replace("{{PRIMARY}}", cal.primary_color)
-        .replace("{{ACCENT}}", cal.accent_color)
-        .replace("{{BG}}", cal.background_color)
-        .replace("{{TEXT_COLOR}}", cal.text_color)
-        .replace("{{TITLE_COLOR}}", cal.title_color)
-        .replace("{{LOGO_URL}}", cal.logo_url or "")
-        .replace("{{LOGO_HEIGHT}}", str(cal.logo_height))
-        .replace("{{DESKTOP_MONTH}}", sel(cal.desktop_view, "dayGridMonth"))
-        .replace("{{DESKTOP_WEEK}}", sel(cal.desktop_view, "timeGridWeek"))
-        .replace("{{DESKTOP_DAY}}", sel(cal.desktop_view, "timeGridDay"))
-        .replace("{{DESKTOP_LIST}}", sel(cal.desktop_view, "listWeek"))
-        .replace("{{MOBILE_MONTH}}", sel(cal.mobile_view, "dayGridMonth"))
-        .replace("{{MOBILE_WEEK}}", sel(cal.mobile_view, "timeGridWeek"))
-        .replace("{{MOBILE_DAY}}", sel(cal.mobile_view, "timeGridDay"))
-        .replace("{{MOBILE_LIST}}", sel(cal.mobile_view, "listWeek"))
-        .replace("{{SHOW_NAME_CHECKED}}", "checked" if cal.show_name else "")
-        .replace("{{TOKEN_PARAM}}", token_param)
+    return HTMLResponse(
+        render(
+            "edit.html",
+            SLUG=cal.slug,
+            NAME=cal.name,
+            ICS=cal.incoming_ics_url or "",
+            TZ=cal.timezone,
+            PRIMARY=cal.primary_color,
+            ACCENT=cal.accent_color,
+            BG=cal.background_color,
+            TEXT_COLOR=cal.text_color,
+            TITLE_COLOR=cal.title_color,
+            LOGO_URL=cal.logo_url or "",
+            LOGO_HEIGHT=cal.logo_height,
+            DESKTOP_MONTH=sel(cal.desktop_view, "dayGridMonth"),
+            DESKTOP_WEEK=sel(cal.desktop_view, "timeGridWeek"),
+            DESKTOP_DAY=sel(cal.desktop_view, "timeGridDay"),
+            DESKTOP_LIST=sel(cal.desktop_view, "listWeek"),
+            MOBILE_MONTH=sel(cal.mobile_view, "dayGridMonth"),
+            MOBILE_WEEK=sel(cal.mobile_view, "timeGridWeek"),
+            MOBILE_DAY=sel(cal.mobile_view, "timeGridDay"),
+            MOBILE_LIST=sel(cal.mobile_view, "listWeek"),
+            SHOW_NAME_CHECKED="checked" if cal.show_name else "",
+            TOKEN_PARAM=f"?token={token}",
+        )
     )
-    return HTMLResponse(tpl)
 
 
 @app.post("/admin/edit/{slug}")
 async def edit_calendar(
-    request: Request,
     slug: str,
     name: str = Form(...),
     incoming_ics_url: Optional[str] = Form(None),
@@ -246,10 +448,10 @@ async def edit_calendar(
     mobile_view: str = Form("listWeek"),
     show_name: bool = Form(False),
     logo_height: int = Form(40),
-    session: Session = Depends(get_session),
+    token: str = Depends(require_admin),
+    session: AsyncSession = Depends(get_session),
 ):
-    require_admin(request)
-    cal = session.exec(select(Calendar).where(Calendar.slug == slug)).first()
+    cal = (await session.exec(select(Calendar).where(Calendar.slug == slug))).first()
     if not cal:
         raise HTTPException(status_code=404, detail="Calendar not found")
 
@@ -267,207 +469,159 @@ async def edit_calendar(
     cal.logo_height = logo_height
 
     if logo_file and logo_file.filename:
-        dest_dir = pathlib.Path("/data/uploads") / cal.slug
-        dest_dir.mkdir(parents=True, exist_ok=True)
-        dest = dest_dir / logo_file.filename
-        with dest.open("wb") as f:
-            f.write(await logo_file.read())
-        if cal.logo_path:
-            try:
-                os.remove(cal.logo_path)
-            except OSError:
-                pass
+        dest = pathlib.Path("/data/uploads") / cal.slug / logo_file.filename
+        await anyio.to_thread.run_sync(save_upload, logo_file.file, dest)
+        # Re-uploading under the same filename has already overwritten it
+        if cal.logo_path and cal.logo_path != str(dest):
+            await anyio.to_thread.run_sync(remove_files, cal.logo_path)
         cal.logo_url = f"/uploads/{cal.slug}/{logo_file.filename}"
         cal.logo_path = str(dest)
     elif logo_url is not None:
         cal.logo_url = logo_url or None
 
     session.add(cal)
-    session.commit()
-    token = request.query_params.get("token") or request.headers.get("X-Admin-Token")
-    redirect_url = "/admin"
-    if token:
-        redirect_url += f"?token={token}"
-    return RedirectResponse(url=redirect_url, status_code=status.HTTP_303_SEE_OTHER)
+    await session.commit()
+    invalidate_calendar(slug)
+    ICS_CACHE.pop(slug, None)
+    return admin_redirect(token)
 # ICS proxy so browsers can load remote feeds without CORS issues
 @app.api_route("/api/cal/{slug}/ics", methods=["GET", "HEAD"], response_class=PlainTextResponse)
-async def proxy_ics(slug: str, session: Session = Depends(get_session)):
-    cal = session.exec(select(Calendar).where(Calendar.slug == slug)).first()
+async def proxy_ics(slug: str, session: AsyncSession = Depends(get_session)):
+    cal = await get_calendar_by_slug(session, slug)
     if not cal or not cal.incoming_ics_url:
         raise HTTPException(status_code=404, detail="Calendar or ICS not found")
     try:
-        async with httpx.AsyncClient(timeout=20) as c:
-            r = await c.get(
-                cal.incoming_ics_url,
-                headers={"User-Agent": "CalendarHub", "Accept": "text/calendar"},
-            )
-        r.raise_for_status()
+        body = await fetch_ics(slug, cal.incoming_ics_url)
     except httpx.HTTPError as e:
         raise HTTPException(status_code=502, detail=f"ICS fetch failed: {e}")
-    return PlainTextResponse(content=r.text, media_type="text/calendar")
+    return Response(content=body, media_type="text/calendar")
+
+# Embed output depends only on the calendar snapshot (plus the public base URL
+# for the loader), so it is memoized on those. Edited calendars produce a new
+# snapshot and simply miss; stale renders age out of the LRU.
+RENDER_CACHE_SIZE = 0 if TEMPLATE_RELOAD else 1024
+
+@functools.lru_cache(maxsize=RENDER_CACHE_SIZE)
+def render_embed_page(cal: CalendarSnapshot) -> str:
+    return render(
+        "embed.html",
+        LOGO_URL=cal.logo_url,
+        SHOW_NAME=cal.show_name,
+        TITLE_TEXT=cal.name,
+        SLUG=cal.slug,
+        PRIMARY=cal.primary_color,
+        ACCENT=cal.accent_color,
+        BG=cal.background_color,
+        TEXT_COLOR=cal.text_color,
+        TITLE_COLOR=cal.title_color,
+        DESKTOP_VIEW=cal.desktop_view,
+        MOBILE_VIEW=cal.mobile_view,
+        TZ=cal.timezone,
+        LOGO_HEIGHT=cal.logo_height,
+    )
+
+@functools.lru_cache(maxsize=RENDER_CACHE_SIZE)
+def render_embed_script(cal: CalendarSnapshot, base: str) -> str:
+    logo_url = ""
+    if cal.logo_url:
+        if cal.logo_url.startswith("http://") or cal.logo_url.startswith("https://"):
+            logo_url = cal.logo_url
+        else:
+            logo_url = f"{base}{cal.logo_url}"
+    return render(
+        "embed.js",
+        BASE=base,
+        NAME=cal.name,
+        SLUG=cal.slug,
+        LOGO_URL=logo_url,
+        SHOW_NAME=cal.show_name,
+        PRIMARY=cal.primary_color,
+        ACCENT=cal.accent_color,
+        BG=cal.background_color,
+        TEXT_COLOR=cal.text_color,
+        TITLE_COLOR=cal.title_color,
+        DESKTOP_VIEW=cal.desktop_view,
+        MOBILE_VIEW=cal.mobile_view,
+        TZ=cal.timezone,
+        LOGO_HEIGHT=cal.logo_height,
+        ICS_URL=f"{base}/api/cal/{cal.slug}/ics",
+    )
 
 # Public embed page
 @app.get("/c/{slug}/embed", response_class=HTMLResponse)
-async def embed(slug: str, session: Session = Depends(get_session)):
-    cal = session.exec(select(Calendar).where(Calendar.slug == slug, Calendar.is_public == True)).first()
+async def embed(slug: str, session: AsyncSession = Depends(get_session)):
+    cal = await get_calendar_by_slug(session, slug)
     if not cal:
         raise HTTPException(status_code=404, detail="Calendar not found")
-    with open("templates/embed.html", "r", encoding="utf-8") as f:
-        tpl = f.read()
-    logo_html = (
-        f"<img class='logo' src=\"{cal.logo_url}\" alt=\"{cal.name} logo\">"
-        if cal.logo_url
-        else ""
-    )
-    title_html = f"<h1 style='margin-left:8px'>{cal.name}</h1>" if cal.show_name else ""
-    tpl = (
-        tpl.replace("{{LOGO}}", logo_html)
-        .replace("{{TITLE}}", title_html)
-        .replace("{{TITLE_TEXT}}", cal.name)
-        .replace("{{SLUG}}", cal.slug)
-        .replace("{{PRIMARY}}", cal.primary_color)
-        .replace("{{ACCENT}}", cal.accent_color)
-        .replace("{{BG}}", cal.background_color)
-        .replace("{{TEXT_COLOR}}", cal.text_color)
-        .replace("{{TITLE_COLOR}}", cal.title_color)
-        .replace("{{DESKTOP_VIEW}}", cal.desktop_view)
-        .replace("{{MOBILE_VIEW}}", cal.mobile_view)
-        .replace("{{TZ}}", cal.timezone)
-        .replace("{{LOGO_HEIGHT}}", str(cal.logo_height))
-    )
-    return HTMLResponse(tpl)
+    return HTMLResponse(render_embed_page(cal))
 
 
 @app.get("/c/{slug}/embed.js", response_class=PlainTextResponse)
-async def embed_script(request: Request, slug: str, session: Session = Depends(get_session)):
+async def embed_script(request: Request, slug: str, session: AsyncSession = Depends(get_session)):
     """Return a JS loader that renders the calendar into #calendar-container."""
-    cal = session.exec(
-        select(Calendar).where(Calendar.slug == slug, Calendar.is_public == True)
-    ).first()
+    cal = await get_calendar_by_slug(session, slug)
     if not cal:
         raise HTTPException(status_code=404, detail="Calendar not found")
 
     scheme = request.headers.get("x-forwarded-proto", request.url.scheme)
     host = request.headers.get("x-forwarded-host", request.url.netloc)
     base = f"{scheme}://{host}".rstrip("/")
-    logo_url = ""
-    if cal.logo_url:
-        if cal.logo_url.startswith("http://") or cal.logo_url.startswith("https://"):
-            logo_url = cal.logo_url
-        else:
-            logo_url = f"{base}{cal.logo_url}"
-
-    logo_html = (
-        f'<img class="logo" src="{logo_url}" alt="{cal.name} logo">' if logo_url else ""
-    )
-    title_html = f"<h1 style='margin-left:8px'>{cal.name}</h1>" if cal.show_name else ""
-    ics_url = f"{base}/api/cal/{cal.slug}/ics"
-
-    js = f"""
-(function(){{
-  const loadStyle = href => new Promise((res, rej) => {{
-    if (document.querySelector(`link[href="${{href}}"]`)) return res();
-    const l=document.createElement('link');
-    l.rel='stylesheet';
-    l.href=href;
-    l.onload=res;
-    l.onerror=rej;
-    document.head.appendChild(l);
-  }});
-  const loadScript = src => new Promise((res, rej) => {{
-    if (document.querySelector(`script[src="${{src}}"]`)) return res();
-    const s=document.createElement('script');
-    s.src=src;
-    s.onload=res;
-    s.onerror=rej;
-    document.head.appendChild(s);
-  }});
-
-  async function init(){{
-    await loadStyle('https://cdn.jsdelivr.net/npm/fullcalendar@6.1.15/index.global.min.css');
-    await loadStyle('{base}/static/styles.css');
-    await loadScript('https://cdn.jsdelivr.net/npm/fullcalendar@6.1.15/index.global.min.js');
-    await loadScript('https://cdn.jsdelivr.net/npm/ical.js@1.4.0/build/ical.min.js');
-    await loadScript('https://cdn.jsdelivr.net/npm/@fullcalendar/icalendar@6.1.15/index.global.min.js');
-
-    const container=document.getElementById('calendar-container');
-    if(!container) return;
-    container.innerHTML=`<div class='wrap'><header class=\"bar\"><div class=\"left\">{logo_html}{title_html}</div><div class=\"muted\">{cal.timezone}</div></header><div id=\"calendar\"></div></div>`;
-    const style=document.createElement('style');
-    style.textContent=`#calendar-container{{--primary:{cal.primary_color};--accent:{cal.accent_color};--bg:{cal.background_color};--text:{cal.text_color};--title:{cal.title_color};}}#calendar-container .logo{{height:{cal.logo_height}px;object-fit:contain}}`;
-    document.head.appendChild(style);
-    const el=container.querySelector('#calendar');
-    const isMobile=window.matchMedia('(max-width: 768px)').matches;
-    const initialView=isMobile?'{cal.mobile_view}':'{cal.desktop_view}';
-    const headerDesktop={{ left:'prev,next today', center:'title', right:'dayGridMonth,timeGridWeek,timeGridDay,listWeek' }};
-    const headerMobile={{ center:'title', left:'', right:'' }};
-    const footerMobile={{ left:'prev,next today', right:'dayGridMonth,timeGridWeek,timeGridDay,listWeek' }};
-    const colors=getComputedStyle(container);
-    const calendar=new FullCalendar.Calendar(el,{{plugins:[FullCalendar.icalendarPlugin],themeSystem:'standard',initialView,headerToolbar:isMobile?headerMobile:headerDesktop,footerToolbar:isMobile?footerMobile:undefined,height:'auto',nowIndicator:true,eventDisplay:'block',eventColor:colors.getPropertyValue('--primary'),eventBorderColor:colors.getPropertyValue('--accent'),eventTextColor:colors.getPropertyValue('--text'),timeZone:'{cal.timezone}',eventSources:[{{url:'{ics_url}',format:'ics'}}]}});
-    calendar.render();
-    }}
-    if (document.readyState === 'loading') {{
-      document.addEventListener('DOMContentLoaded', init);
-    }} else {{
-      init();
-    }}
-  }})();
-  """
-    return PlainTextResponse(js, media_type="text/javascript")
+    return PlainTextResponse(render_embed_script(cal, base), media_type="text/javascript")
 
 
 @app.get("/admin/embed-code/{slug}", response_class=HTMLResponse)
-async def embed_code(request: Request, slug: str, session: Session = Depends(get_session)):
+async def embed_code(
+    request: Request,
+    slug: str,
+    token: str = Depends(require_admin),
+    session: AsyncSession = Depends(get_session),
+):
     """Return a page with embed snippets for a calendar."""
-    require_admin(request)
-    cal = session.exec(select(Calendar).where(Calendar.slug == slug)).first()
-    if not cal:
+    name = (await session.exec(select(Calendar.name).where(Calendar.slug == slug))).first()
+    if name is None:
         raise HTTPException(status_code=404, detail="Calendar not found")
     scheme = request.headers.get("x-forwarded-proto", request.url.scheme)
     host = request.headers.get("x-forwarded-host", request.url.netloc)
     base = f"{scheme}://{host}".rstrip("/")
-    iframe_src = f"{base}/c/{cal.slug}/embed"
-    iframe_code = (
-        f"<iframe src=\"{iframe_src}\" style=\"border:0;width:100%;height:600px\"></iframe>"
-    )
-    script_src = f"{base}/c/{cal.slug}/embed.js"
-    js_code = (
-        f"<div id=\"calendar-container\"></div><script src=\"{script_src}\"></script>"
-    )
-    html = (
-        "<html><head><title>Embed Code</title>"
-        "<link rel='stylesheet' href='/static/styles.css'></head><body>"
-        f"<main class='wrap'><h2>Embed code for {cal.name}</h2>"
-        "<h3>Iframe</h3>"
-        f"<textarea readonly style='width:100%;height:120px'>{iframe_code}</textarea>"
-        "<h3>JavaScript</h3>"
-        f"<textarea readonly style='width:100%;height:120px'>{js_code}</textarea>"
-        "</main></body></html>"
+    return HTMLResponse(
+        render(
+            "embed_code.html",
+            NAME=name,
+            IFRAME_SRC=f"{base}/c/{slug}/embed",
+            SCRIPT_SRC=f"{base}/c/{slug}/embed.js",
+        )
     )
-    return HTMLResponse(html)
 
 
 @app.post("/admin/delete/{slug}")
-async def delete_calendar(request: Request, slug: str, session: Session = Depends(get_session)):
+async def delete_calendar(slug: str, token: str = Depends(require_admin), session: AsyncSession = Depends(get_session)):
     """Delete a calendar and its uploaded logo."""
-    require_admin(request)
-    cal = session.exec(select(Calendar).where(Calendar.slug == slug)).first()
+    cal = (await session.exec(select(Calendar).where(Calendar.slug == slug))).first()
     if not cal:
         raise HTTPException(status_code=404, detail="Calendar not found")
     if cal.logo_path:
-        try:
-            os.remove(cal.logo_path)
-        except OSError:
-            pass
-    session.delete(cal)
-    session.commit()
-    token = request.query_params.get("token") or request.headers.get("X-Admin-Token")
-    redirect_url = "/admin"
-    if token:
-        redirect_url += f"?token={token}"
-    return RedirectResponse(url=redirect_url, status_code=status.HTTP_303_SEE_OTHER)
+        await anyio.to_thread.run_sync(remove_files, cal.logo_path)
+    await session.delete(cal)
+    await session.commit()
+    invalidate_calendar(slug)
+    ICS_CACHE.pop(slug, None)
+    return admin_redirect(token)
 
 @app.on_event("startup")
-def on_start():
+async def on_start():
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    init_db()
+    await init_db()
+    # One pooled client for upstream ICS fetches so connections are reused
+    app.state.http = httpx.AsyncClient(
+        timeout=20,
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=20),
+    )
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await app.state.http.aclose()
+    async with engine.connect() as conn:
+        await conn.exec_driver_sql("PRAGMA optimize")
+    await engine.dispose()
+
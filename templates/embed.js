@@ -0,0 +1,57 @@
+(function(){
+  const loadStyle = href => new Promise((res, rej) => {
+    if (document.querySelector(`link[href="${href}"]`)) return res();
+    const l=document.createElement('link');
+    l.rel='stylesheet';
+    l.href=href;
+    l.onload=res;
+    l.onerror=rej;
+    document.head.appendChild(l);
+  });
+  const loadScript = src => new Promise((res, rej) => {
+    if (document.querySelector(`script[src="${src}"]`)) return res();
+    const s=document.createElement('script');
+    s.src=src;
+    s.onload=res;
+    s.onerror=rej;
+    document.head.appendChild(s);
+  });
+
+  async function init(){
+    await loadStyle('https://cdn.jsdelivr.net/npm/fullcalendar@6.1.15/index.global.min.css');
+    await loadStyle({{ (BASE ~ '/static/styles.css')|tojson }});
+    await loadScript('https://cdn.jsdelivr.net/npm/fullcalendar@6.1.15/index.global.min.js');
+    await loadScript('https://cdn.jsdelivr.net/npm/ical.js@1.4.0/build/ical.min.js');
+    await loadScript('https://cdn.jsdelivr.net/npm/@fullcalendar/icalendar@6.1.15/index.global.min.js');
+
+    const container=document.getElementById('calendar-container');
+    if(!container) return;
+    {%- set markup -%}
+      <div class='wrap'><header class="bar"><div class="left">
+      {%- if LOGO_URL %}<img class="logo" src="{{ LOGO_URL|e }}" alt="{{ NAME|e }} logo">{% endif -%}
+      {%- if SHOW_NAME %}<h1 style='margin-left:8px'>{{ NAME|e }}</h1>{% endif -%}
+      </div><div class="muted">{{ TZ|e }}</div></header><div id="calendar"></div></div>
+    {%- endset %}
+    container.innerHTML={{ markup|tojson }};
+    const style=document.createElement('style');
+    {%- set css -%}
+      #calendar-container{--primary:{{ PRIMARY }};--accent:{{ ACCENT }};--bg:{{ BG }};--text:{{ TEXT_COLOR }};--title:{{ TITLE_COLOR }};}#calendar-container .logo{height:{{ LOGO_HEIGHT }}px;object-fit:contain}
+    {%- endset %}
+    style.textContent={{ css|tojson }};
+    document.head.appendChild(style);
+    const el=container.querySelector('#calendar');
+    const isMobile=window.matchMedia('(max-width: 768px)').matches;
+    const initialView=isMobile?{{ MOBILE_VIEW|tojson }}:{{ DESKTOP_VIEW|tojson }};
+    const headerDesktop={ left:'prev,next today', center:'title', right:'dayGridMonth,timeGridWeek,timeGridDay,listWeek' };
+    const headerMobile={ center:'title', left:'', right:'' };
+    const footerMobile={ left:'prev,next today', right:'dayGridMonth,timeGridWeek,timeGridDay,listWeek' };
+    const colors=getComputedStyle(container);
+    const calendar=new FullCalendar.Calendar(el,{plugins:[FullCalendar.icalendarPlugin],themeSystem:'standard',initialView,headerToolbar:isMobile?headerMobile:headerDesktop,footerToolbar:isMobile?footerMobile:undefined,height:'auto',nowIndicator:true,eventDisplay:'block',eventColor:colors.getPropertyValue('--primary'),eventBorderColor:colors.getPropertyValue('--accent'),eventTextColor:colors.getPropertyValue('--text'),timeZone:{{ TZ|tojson }},eventSources:[{url:{{ ICS_URL|tojson }},format:'ics'}]});
+    calendar.render();
+    }
+    if (document.readyState === 'loading') {
+      document.addEventListener('DOMContentLoaded', init);
+    } else {
+      init();
+    }
+  })();